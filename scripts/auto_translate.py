@@ -1,14 +1,43 @@
-import json
+import asyncio
+import functools
+import hashlib
+import logging
 import os
+import string
 import subprocess
-from time import time
+import time
 import traceback
 from datetime import datetime
-from openai import OpenAI, APIConnectionError
+import httpx
+import orjson
+from aiolimiter import AsyncLimiter
+from openai import AsyncOpenAI, APIConnectionError, APITimeoutError, BadRequestError, InternalServerError, NotFoundError, RateLimitError
+from tenacity import retry, retry_if_exception_type, stop_after_attempt, wait_random_exponential
 
 LOCALES_DIR = "locales"
+# Translations of previously seen source values, keyed by language and value hash
+CACHE_DIR = "cache"
 SOURCE_LANG = "en"
-CHARS_PER_PARTITION = 6000
+# Max characters of source keys and values sent per request
+CHARS_PER_PARTITION = int(os.getenv("MAX_PARTITION_CHARS", "40000"))
+MAX_CONCURRENT_REQUESTS = 10
+# HTTP connection pool shared by all requests
+MAX_CONNECTIONS = 64
+MAX_KEEPALIVE_CONNECTIONS = 32
+# OpenAI rate limits for MODEL, requests are throttled to stay under these
+MAX_REQUESTS_PER_MINUTE = 500
+MAX_TOKENS_PER_MINUTE = 500000
+# Attempts per request on rate limit, connection and server errors. Timeouts are not
+# retried, the partition is split instead (see translate_partition)
+MAX_API_ATTEMPTS = 5
+MODEL = "gpt-5"
+# Batch API polling interval in seconds
+BATCH_POLL_INTERVAL = 60
+# Stop waiting for batches after this many seconds, so the job ends before GitHub's
+# 6 hour limit. Batches still running are collected by the next run.
+BATCH_MAX_WAIT = 5 * 60 * 60
+# Submitted batches that have not been collected yet, one file per language
+BATCH_DIR = f"{CACHE_DIR}/batches"
 
 # Define language names
 # Note: This list used to get the language name from the locale code.
@@ -38,177 +67,581 @@ LANG_NAMES = {
     "zh-cn": "Chinese (Simplified)",
     "zh-tw": "Chinese (Traditional)",
 }
-TARGET_LANG = os.environ["TARGET_LANG"]
+logger = logging.getLogger("auto_translate")
+START_TIME = time.monotonic()
+
+# Comma-separated list of locale codes to translate, e.g. "fr,el,da"
+TARGET_LANGS = [code.strip() for code in os.environ["TARGET_LANG"].split(",") if code.strip()]
+# Language names of the target languages, looked up once
+TARGET_LANG_NAMES = {lang: LANG_NAMES.get(lang, lang) for lang in TARGET_LANGS}
 
 
 def get_source_dict():
     """Returns a dict of {key: value} for all keys in source json."""
-    with open(f"{LOCALES_DIR}/{SOURCE_LANG}.json", encoding="utf-8") as f:
-        current = json.load(f)
+    with open(f"{LOCALES_DIR}/{SOURCE_LANG}.json", "rb") as f:
+        current = orjson.loads(f.read())
 
     return current
 
 
+def save_locale_dict(path, data):
+    """Save a locale dict as json with 4-space indentation."""
+    # orjson only supports 2-space indentation; locale files are flat and orjson escapes
+    # newlines inside strings, so every newline followed by 2 spaces starts a key
+    output = orjson.dumps(data, option=orjson.OPT_INDENT_2).replace(b"\n  ", b"\n    ")
+    with open(path, "wb") as f:
+        f.write(output)
+
+
 def get_changed_keys():
-    """Returns a list for changed or new keys in source json."""
+    """Returns a frozenset of changed or new keys in source json."""
     # If the event is a manual trigger, don't check for changes, only missing translations will be added
     event_name = os.getenv("GITHUB_EVENT_NAME")
     if event_name == "workflow_dispatch":
-        return []
+        return frozenset()
 
     # Compare last commit of source json to current
-    diff_output = subprocess.check_output(
-        ["git", "diff", "HEAD^", "HEAD", f"{LOCALES_DIR}/{SOURCE_LANG}.json"]
-    ).decode()
+    source_path = f"{LOCALES_DIR}/{SOURCE_LANG}.json"
+    # without the previous commit (e.g. a shallow clone) every key would look changed
+    if subprocess.run(["git", "rev-parse", "--verify", "--quiet", "HEAD^"], stdout=subprocess.DEVNULL).returncode != 0:
+        raise Exception("Previous commit not found, the repository must be checked out with its history.")
+    # skip loading both versions when the last commit only touched other locale files
+    if subprocess.run(["git", "diff", "--quiet", "HEAD^", "HEAD", "--", source_path]).returncode == 0:
+        return frozenset()
+    current = orjson.loads(subprocess.check_output(["git", "show", f"HEAD:{source_path}"]))
+    if subprocess.run(["git", "cat-file", "-e", f"HEAD^:{source_path}"], stderr=subprocess.DEVNULL).returncode == 0:
+        previous = orjson.loads(subprocess.check_output(["git", "show", f"HEAD^:{source_path}"]))
+    else:
+        # source json did not exist in the previous commit, so every key is new
+        previous = {}
 
-    # parse diff_output to detect exact changes
-    changes = []
-    for line in diff_output.splitlines():
-        if line.startswith("+") and not line.startswith("+++"):
-            # This is a new or changed line
-            key_value = line[1:].strip()
-            if ":" in key_value:
-                key = key_value.split(":", 1)[0].strip().strip('"')
-                changes.append(key)
+    return frozenset(k for k, v in current.items() if previous.get(k) != v)
 
-    return changes
 
+@functools.lru_cache(maxsize=None)
+def load_prompt():
+    """Returns the prompt text, read from file once."""
+    with open("scripts/translate_prompt.txt", encoding="utf-8") as f:
+        return f.read()
 
-def translate_text(client, json_text):
-    """Translate keeping placeholders intact."""
-    target_lang = TARGET_LANG
-    lang_name = LANG_NAMES.get(TARGET_LANG, TARGET_LANG)
 
-    # read prompt text from file
-    with open("scripts/translate_prompt.txt", encoding="utf-8") as f:
-        prompt = f.read()
-
-    # read locale_instructions file if present
-    locale_instructions = ""
-    locale_instructions_path = f"scripts/locale_instructions/{target_lang}.txt"
-    if os.path.exists(locale_instructions_path):
-        with open(locale_instructions_path, encoding="utf-8") as f:
-            locale_instructions = f.read()
-
-    # replace placeholders in prompt
-    prompt = prompt.replace("%json_text%", json_text)
-    prompt = prompt.replace("%target_lang%", lang_name)
-    prompt = prompt.replace("%lang_code%", TARGET_LANG)
-    prompt = prompt.replace("%locale_instructions%", locale_instructions)
-
-    resp = client.chat.completions.create(
-        model="gpt-5",
-        messages=[{"role": "system", "content": prompt}],
-        response_format={
-            "type": "json_object",
-        }
+@functools.lru_cache(maxsize=None)
+def load_locale_instructions(lang):
+    """Returns the locale instructions for a language, or an empty string if there is no file."""
+    locale_instructions_path = f"scripts/locale_instructions/{lang}.txt"
+    if not os.path.exists(locale_instructions_path):
+        return ""
+    with open(locale_instructions_path, encoding="utf-8") as f:
+        return f.read()
+
+
+# placeholders in the prompt file use string.Template syntax, e.g. ${target_lang}
+PROMPT_TEMPLATE = string.Template(load_prompt())
+
+
+@functools.lru_cache(maxsize=None)
+def build_system_prompt(lang):
+    """Build the translation instructions for a language, which are the same for every request."""
+    lang_name = TARGET_LANG_NAMES[lang]
+    locale_instructions = load_locale_instructions(lang)
+
+    # replace placeholders in prompt in a single pass
+    return PROMPT_TEMPLATE.substitute(
+        target_lang=lang_name,
+        lang_code=lang,
+        locale_instructions=locale_instructions,
     )
+
+
+def build_request_body(json_text, lang):
+    """Returns the chat completion request body for the given JSON text."""
+    # The static instructions come first and the JSON last. OpenAI only caches prompt
+    # prefixes of 1024 tokens or more and the instructions are about 250 tokens, so
+    # requests don't hit the prompt cache yet; they would if the instructions grew.
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": build_system_prompt(lang)},
+            {"role": "user", "content": "JSON to translate:\n" + json_text},
+        ],
+        "prompt_cache_key": f"auto-translate-{lang}",
+        "response_format": {
+            "type": "json_object",
+        },
+    }
+
+
+def estimate_tokens(request_body, json_text):
+    """Roughly estimate the tokens used by a request, including the response."""
+    prompt_length = sum(len(message["content"]) for message in request_body["messages"])
+    # ~4 characters per token for the prompt; the response is about as long as the
+    # JSON being translated but tokenizes worse for non-latin scripts
+    return prompt_length // 4 + len(json_text) // 2
+
+
+rpm_limiter = AsyncLimiter(MAX_REQUESTS_PER_MINUTE, 60)
+tpm_limiter = AsyncLimiter(MAX_TOKENS_PER_MINUTE, 60)
+
+
+@retry(
+    stop=stop_after_attempt(MAX_API_ATTEMPTS),
+    wait=wait_random_exponential(min=1, max=60),
+    retry=retry_if_exception_type((RateLimitError, APIConnectionError, InternalServerError)),
+    reraise=True,
+)
+async def translate_text(client, json_text, lang):
+    """Translate keeping placeholders intact."""
+    request_body = build_request_body(json_text, lang)
+    # wait until the request fits in both the request and token rate limits
+    await rpm_limiter.acquire()
+    await tpm_limiter.acquire(min(estimate_tokens(request_body, json_text), MAX_TOKENS_PER_MINUTE))
+    # retried with backoff by the decorator above, so the SDK must not retry on top of it
+    resp = await client.with_options(max_retries=0).chat.completions.create(**request_body)
     return resp.choices[0].message.content.strip()
 
 
-def translate_text_partitioned(client, json_data, chars_per_partition):
-    """Translate JSON data in partitions to avoid token limits."""
-    if not json_data:
-        return {}
+def split_partitions(json_data, chars_per_partition):
+    """Split JSON data into partitions of at most chars_per_partition characters.
 
+    A partition is closed before a key would take it over the limit; a key larger
+    than chars_per_partition gets a partition of its own.
+    """
     partitions = []
     current_partition = {}
     char_count = 0
-    lang_name = LANG_NAMES.get(TARGET_LANG, TARGET_LANG)
 
     for key, value in json_data.items():
-        current_partition[key] = value
-        char_count += len(key) + len(value)
-        if char_count >= chars_per_partition:
+        size = len(key) + len(value)
+        if current_partition and char_count + size > chars_per_partition:
             partitions.append(current_partition)
             current_partition = {}
             char_count = 0
+        current_partition[key] = value
+        char_count += size
 
     if current_partition:
         partitions.append(current_partition)
 
+    return partitions
+
+
+def serialize_partition(part):
+    """Returns the JSON text of a partition as sent to the model."""
+    return orjson.dumps(part, option=orjson.OPT_INDENT_2).decode("utf-8")
+
+
+# Serialized partitions by the keys they were split from. Values always come from
+# the source json, so languages translating the same keys share the same partitions.
+serialized_partitions = {}
+
+
+def get_serialized_partitions(json_data, chars_per_partition):
+    """Returns a list of (partition, partition JSON text) tuples for the given JSON data."""
+    cache_key = (tuple(json_data), chars_per_partition)
+    if cache_key not in serialized_partitions:
+        serialized_partitions[cache_key] = [
+            (part, serialize_partition(part)) for part in split_partitions(json_data, chars_per_partition)
+        ]
+    return serialized_partitions[cache_key]
+
+
+async def translate_text_partitioned(client, sem, json_data, lang, chars_per_partition):
+    """Translate JSON data in partitions to avoid token limits.
+
+    Partitions are sent concurrently; the semaphore is shared by all languages
+    so that at most MAX_CONCURRENT_REQUESTS requests are in flight at a time.
+    """
+    if not json_data:
+        return {}
+
+    partitions = get_serialized_partitions(json_data, chars_per_partition)
+    lang_name = TARGET_LANG_NAMES[lang]
+
+    logger.info("Translating %s keys in %s partitions for %s (%s)...", len(json_data), len(partitions), lang_name, lang)
+    tasks = [
+        translate_partition_with_retry(sem, client, lang, index, part, json_text)
+        for index, (part, json_text) in enumerate(partitions)
+    ]
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+
+    # merge results in partition order, skipping failed partitions
     translated_data = {}
-    remaining_keys = len(json_data)
-    for part in partitions:
-        try:
-            print(f"Translating {len(part)} keys (total remaining: {remaining_keys}) for {lang_name} ({TARGET_LANG})...")
-            remaining_keys -= len(part)
-            try:
-                translated_part = translate_partition(client, part)
-            except APIConnectionError:
-                print("APIConnectionError occurred.")
-                time.sleep(5)
-                translated_part = None
+    for index, result in enumerate(results):
+        if isinstance(result, BaseException):
+            log_error(result, lang)
+            logger.error("Error occurred while translating partition %s/%s for %s (%s), returning partial results. Error: %s", index + 1, len(partitions), lang_name, lang, result)
+            continue
+        translated_data.update(result)
 
-            if not translated_part:
-                print("Retrying...")
-                translated_part = translate_partition(client, part)
+    return translated_data
+
+
+async def translate_partition_with_retry(sem, client, lang, index, part, json_text):
+    """Translate a single partition, retrying once for the keys missing from the response.
+
+    Transient API errors are retried with backoff by translate_text.
+    """
+    lang_name = TARGET_LANG_NAMES[lang]
+    async with sem:
+        logger.info("Translating partition %s (%s keys) for %s (%s)...", index + 1, len(part), lang_name, lang)
+        translated_part = await translate_partition(client, part, json_text, lang)
+
+        missing = {key: value for key, value in part.items() if key not in translated_part}
+        if missing:
+            logger.warning("Retrying %s of %s keys of partition %s for %s (%s)...", len(missing), len(part), index + 1, lang_name, lang)
+            try:
+                translated_part.update(await translate_partition(client, missing, serialize_partition(missing), lang))
+            except Exception as e:
                 if not translated_part:
-                    raise ValueError("Translation failed after 2 tries.")
-            translated_data.update(translated_part)
-        except Exception as e:
-            log_error(e)
-            print(f"Error occurred while translating {lang_name} ({TARGET_LANG}), returning partial results. Error: {e}")
-            break
+                    raise
+                # keep the keys the first attempt translated
+                log_error(e, lang)
+                logger.error("Error occurred while retrying partition %s for %s (%s): %s", index + 1, lang_name, lang, e)
+            if not translated_part:
+                raise ValueError("Translation failed after 2 tries.")
 
-    return translated_data
+            missing_count = len(part) - len(translated_part)
+            if missing_count:
+                log_error(ValueError(f"{missing_count} keys of partition {index + 1} failed to translate after 2 tries."), lang)
+                logger.error("%s keys of partition %s failed to translate for %s (%s) after 2 tries, returning partial results.", missing_count, index + 1, lang_name, lang)
+    return translated_part
 
 
-def translate_partition(client, part):
-    lang_name = LANG_NAMES.get(TARGET_LANG, TARGET_LANG)
-    json_text = json.dumps(part, ensure_ascii=False, indent=2)
-    translated_text = translate_text(client, json_text)
+async def translate_partition(client, part, json_text, lang):
+    try:
+        translated_text = await translate_text(client, json_text, lang)
+    except (BadRequestError, APITimeoutError) as e:
+        # a timeout means the response took too long to generate, which retrying the
+        # same partition would not change
+        too_large = isinstance(e, APITimeoutError) or e.code == "context_length_exceeded"
+        if not too_large or len(part) < 2:
+            raise
+
+        # partition is too large for the model, translate each half separately
+        lang_name = TARGET_LANG_NAMES[lang]
+        reason = "timed out" if isinstance(e, APITimeoutError) else "exceeds the context length"
+        logger.warning("Partition of %s keys %s for %s (%s), splitting it.", len(part), reason, lang_name, lang)
+        items = list(part.items())
+        middle = len(items) // 2
+        translated_part = {}
+        errors = []
+        for half in (dict(items[:middle]), dict(items[middle:])):
+            try:
+                translated_part.update(await translate_partition(client, half, serialize_partition(half), lang))
+            except Exception as half_error:
+                errors.append(half_error)
+        if errors and not translated_part:
+            raise errors[0]
+        # keep the half that was translated, the caller retries the missing keys
+        for half_error in errors:
+            log_error(half_error, lang)
+            logger.error("Error occurred while translating half of a partition for %s (%s): %s", lang_name, lang, half_error)
+        return translated_part
+
+    return parse_translation(translated_text, part, lang)
+
+
+def parse_translation(translated_text, part, lang):
+    """Parse the model output for a partition.
+
+    Returns the translations of the partition's keys that have string values.
+    Missing, extra or non-string keys are reported and left out, and an empty
+    dict is returned if the output is not a valid JSON object.
+    """
+    lang_name = TARGET_LANG_NAMES[lang]
+    # ignore any text the model added around the JSON object
+    start = translated_text.find("{")
+    end = translated_text.rfind("}")
     try:
-        return json.loads(translated_text)
-    except json.JSONDecodeError as e:
-        print(f"Error decoding JSON for {lang_name} ({TARGET_LANG}): {e}")
-        print(f"JSON: {translated_text}\n")
+        result = orjson.loads(translated_text[start:end + 1] if start != -1 and end > start else translated_text)
+    except orjson.JSONDecodeError as e:
+        logger.error("Error decoding JSON for %s (%s): %s\nJSON: %s\n", lang_name, lang, e, translated_text)
+        return {}
+
+    if not isinstance(result, dict):
+        logger.error("Translated JSON for %s (%s) is not an object.", lang_name, lang)
+        return {}
+
+    # keep only the valid translations, so that just the rest has to be retried
+    translated = {key: result[key] for key in part if isinstance(result.get(key), str)}
+    if len(translated) != len(part) or len(result) != len(part):
+        logger.error(
+            "Translated JSON for %s (%s) does not match the partition: %s of %s keys valid, %s extra keys.",
+            lang_name, lang, len(translated), len(part), len(result.keys() - part.keys()),
+        )
+    return translated
+
+
+async def translate_text_batched(client, json_data, lang, chars_per_partition):
+    """Translate JSON data in partitions using the OpenAI Batch API.
+
+    All partitions are submitted as a single batch job, which is cheaper than
+    individual requests but may take up to 24 hours to complete. The batch is
+    saved as pending so that, if it does not finish within BATCH_MAX_WAIT, a later
+    run can collect it with collect_pending_batch; nothing is returned in that case.
+    """
+    if not json_data:
         return {}
 
-def log_error(e):
-    log_path = f"{LOCALES_DIR}/{TARGET_LANG}_errors.txt"
+    serialized = get_serialized_partitions(json_data, chars_per_partition)
+    partitions = [part for part, _ in serialized]
+    batch = await submit_batch(client, serialized, lang)
+    save_pending_batch(lang, batch.id, partitions)
+
+    # wait for the batch to finish
+    deadline = START_TIME + BATCH_MAX_WAIT
+    while batch.status not in ("completed", "failed", "expired", "cancelled"):
+        if time.monotonic() + BATCH_POLL_INTERVAL > deadline:
+            logger.warning("Batch %s for %s (%s) is still %s, it will be collected by the next run.", batch.id, TARGET_LANG_NAMES[lang], lang, batch.status)
+            return {}
+        await asyncio.sleep(BATCH_POLL_INTERVAL)
+        batch = await client.batches.retrieve(batch.id)
+        counts = batch.request_counts
+        logger.info("Batch %s is %s (%s/%s requests done).", batch.id, batch.status, counts.completed, counts.total)
+
+    translated_data = await collect_batch(client, batch, partitions, lang)
+    remove_pending_batch(lang)
+    return translated_data
+
+
+async def submit_batch(client, partitions, lang):
+    """Upload one chat completion request per (partition, JSON text) tuple and create a batch job for them."""
+    lines = []
+    for index, (_, json_text) in enumerate(partitions):
+        lines.append(orjson.dumps({
+            "custom_id": f"{lang}:{index}",
+            "method": "POST",
+            "url": "/v1/chat/completions",
+            "body": build_request_body(json_text, lang),
+        }, option=orjson.OPT_APPEND_NEWLINE))
+    batch_input = b"".join(lines)
+
+    batch_file = await client.files.create(file=(f"{lang}_batch.jsonl", batch_input), purpose="batch")
+    batch = await client.batches.create(
+        input_file_id=batch_file.id,
+        endpoint="/v1/chat/completions",
+        completion_window="24h",
+    )
+    logger.info("Submitted batch %s with %s partitions for %s (%s).", batch.id, len(partitions), TARGET_LANG_NAMES[lang], lang)
+    return batch
+
+
+async def collect_batch(client, batch, partitions, lang):
+    """Returns the translations of a finished batch, in partition order."""
+    lang_name = TARGET_LANG_NAMES[lang]
+    if batch.status != "completed" and not batch.output_file_id and not batch.error_file_id:
+        # there is nothing to collect, so the batch no longer needs to be remembered
+        remove_pending_batch(lang)
+        raise ValueError(f"Batch {batch.id} ended with status {batch.status}.")
+
+    # parse results back per partition; requests that failed are written to a separate error file
+    results = {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        output = await client.files.content(file_id)
+        for line in output.content.splitlines():
+            if not line.strip():
+                continue
+            entry = orjson.loads(line)
+            response = entry.get("response") or {}
+            if response.get("status_code") != 200:
+                error = entry.get("error") or response.get("body") or response
+                log_error(ValueError(f"Batch request {entry['custom_id']} failed: {error}"), lang)
+                logger.error("Batch request %s failed: %s", entry["custom_id"], error)
+                continue
+            translated_text = response["body"]["choices"][0]["message"]["content"].strip()
+            index = int(entry["custom_id"].rsplit(":", 1)[1])
+            results[index] = parse_translation(translated_text, partitions[index], lang)
+
+    translated_data = {}
+    for index in range(len(partitions)):
+        if not results.get(index):
+            log_error(ValueError(f"Partition {index + 1}/{len(partitions)} of batch {batch.id} failed to translate."), lang)
+            logger.error("Partition %s/%s failed to translate for %s (%s), returning partial results.", index + 1, len(partitions), lang_name, lang)
+            continue
+        missing_count = len(partitions[index]) - len(results[index])
+        if missing_count:
+            # missing keys stay untranslated and are picked up again by the next run
+            log_error(ValueError(f"{missing_count} keys of partition {index + 1}/{len(partitions)} of batch {batch.id} failed to translate."), lang)
+            logger.error("%s keys of partition %s/%s failed to translate for %s (%s).", missing_count, index + 1, len(partitions), lang_name, lang)
+        translated_data.update(results[index])
+
+    return translated_data
+
+
+def get_pending_batch_path(lang):
+    return f"{BATCH_DIR}/{lang}.json"
+
+
+def save_pending_batch(lang, batch_id, partitions):
+    """Remember a submitted batch and its partitions until its results are collected."""
+    os.makedirs(BATCH_DIR, exist_ok=True)
+    with open(get_pending_batch_path(lang), "wb") as f:
+        f.write(orjson.dumps({"batch_id": batch_id, "partitions": partitions}))
+
+
+def load_pending_batch(lang):
+    """Returns the pending batch of a language, or None if there is none."""
+    pending_path = get_pending_batch_path(lang)
+    if not os.path.exists(pending_path):
+        return None
+    with open(pending_path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def remove_pending_batch(lang):
+    pending_path = get_pending_batch_path(lang)
+    if os.path.exists(pending_path):
+        os.remove(pending_path)
+
+
+async def collect_pending_batch(client, lang, pending):
+    """Collect a batch submitted by an earlier run into the translation cache.
+
+    Returns True if the batch is still running.
+    """
+    try:
+        batch = await client.batches.retrieve(pending["batch_id"])
+    except NotFoundError:
+        # the batch was deleted or belongs to another API key, it can never be collected
+        logger.warning("Batch %s for %s (%s) no longer exists, its keys will be translated again.", pending["batch_id"], TARGET_LANG_NAMES[lang], lang)
+        remove_pending_batch(lang)
+        return False
+    if batch.status not in ("completed", "failed", "expired", "cancelled"):
+        counts = batch.request_counts
+        logger.info("Batch %s for %s (%s) is still %s (%s/%s requests done).", batch.id, TARGET_LANG_NAMES[lang], lang, batch.status, counts.completed, counts.total)
+        return True
+
+    partitions = pending["partitions"]
+    translated_data = await collect_batch(client, batch, partitions, lang)
+    # partitions hold the source values, so the translations can go straight to the cache
+    source_values = {key: value for part in partitions for key, value in part.items()}
+    for key, translation in translated_data.items():
+        save_cached_translation(lang, source_values[key], translation)
+    # only forget the batch once its results are safely in the cache
+    remove_pending_batch(lang)
+    logger.info("Collected %s translations from batch %s for %s (%s).", len(translated_data), batch.id, TARGET_LANG_NAMES[lang], lang)
+    return False
+
+
+def log_error(e, lang):
+    log_path = f"{LOCALES_DIR}/{lang}_errors.txt"
     with open(log_path, "a", encoding="utf-8") as f:
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         f.write(f"[{timestamp}] {repr(e)}\n")
-        f.write(traceback.format_exc() + "\n")
+        f.write("".join(traceback.format_exception(type(e), e, e.__traceback__)) + "\n")
 
-def main():
-    # ensure target language is set
-    if not TARGET_LANG:
-        print("TARGET_LANG environment variable is not set. Exiting.")
-        return
 
-    # ensure target language is not the source language
-    if TARGET_LANG == SOURCE_LANG:
-        print(f"Target language {TARGET_LANG} is the same as source language {SOURCE_LANG}. No translation needed.")
-        return
+def get_cache_path(lang, source_value):
+    """Returns the cache file path for the translation of a source value."""
+    h = hashlib.sha256((lang + "\0" + source_value).encode("utf-8")).hexdigest()
+    return f"{CACHE_DIR}/{lang}/{h[:2]}/{h}.txt"
 
-    # exit with error if OPENAI_API_KEY is not set
-    if "OPENAI_API_KEY" not in os.environ:
-        raise Exception("Environment variable 'OPENAI_API_KEY' is not set. Exiting.")
 
-    client = OpenAI(api_key=os.environ["OPENAI_API_KEY"])
-    all_keys = get_source_dict()
-    changes = get_changed_keys()
-    target_path = f"{LOCALES_DIR}/{TARGET_LANG}.json"
-    lang_name = LANG_NAMES.get(TARGET_LANG, TARGET_LANG)
+def load_cached_translation(lang, source_value):
+    """Returns the cached translation of a source value, or None if it is not cached."""
+    cache_path = get_cache_path(lang, source_value)
+    if not os.path.exists(cache_path):
+        return None
+    with open(cache_path, encoding="utf-8", newline="") as f:
+        return f.read()
+
+
+def save_cached_translation(lang, source_value, translation):
+    cache_path = get_cache_path(lang, source_value)
+    os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+    with open(cache_path, "w", encoding="utf-8", newline="") as f:
+        f.write(translation)
+
+
+def create_client():
+    """Create an OpenAI client that reuses HTTP/2 connections across requests."""
+    transport = httpx.AsyncHTTPTransport(
+        http2=True,
+        limits=httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS),
+    )
+    # large partitions can take several minutes to translate, so only the connect timeout is short
+    http_client = httpx.AsyncClient(transport=transport, timeout=httpx.Timeout(600.0, connect=10.0))
+    return AsyncOpenAI(api_key=os.environ["OPENAI_API_KEY"], http_client=http_client)
+
+
+def prepare_language(lang, all_keys, changes):
+    """Find the missing or changed keys of a target language.
 
-    # Load existing translations
+    Returns the existing translations to keep and a dict of {source value: [keys]}
+    for the values that need translating.
+    """
+    target_path = f"{LOCALES_DIR}/{lang}.json"
+    lang_name = TARGET_LANG_NAMES[lang]
+
+    # Load existing translations, if the target file does not exist all keys are translated
+    existing_data = {}
     if os.path.exists(target_path):
-        with open(target_path, encoding="utf-8") as f:
-            target_data = json.load(f)
-            # Remove keys not in source json
-            target_data = {k: v for k, v in target_data.items() if k in all_keys}
-            # Make json of all added or changed keys
-            json_to_translate = {k: all_keys[k] for k in all_keys if k not in target_data or k in changes}
-    else:
-        # If the target file does not exist, create a new one with all keys
-        target_data = {}
-        json_to_translate = all_keys
+        with open(target_path, "rb") as f:
+            existing_data = orjson.loads(f.read())
+
+    # In one pass over the source json, keep existing translations of source keys (dropping
+    # keys not in source json) and make json of all added or changed keys.
+    # Old translations of changed keys are kept as a fallback if translating them fails.
+    target_data = {}
+    json_to_translate = {}
+    for key, value in all_keys.items():
+        if key in existing_data:
+            target_data[key] = existing_data[key]
+            if key not in changes:
+                continue
+        json_to_translate[key] = value
+
+    # Reuse cached translations of unchanged source values
+    cache_hits = 0
+    for key, value in list(json_to_translate.items()):
+        cached = load_cached_translation(lang, value)
+        if cached is not None:
+            target_data[key] = cached
+            del json_to_translate[key]
+            cache_hits += 1
+    if cache_hits:
+        logger.info("%s keys loaded from cache for %s (%s).", cache_hits, lang_name, lang)
+
+    # Translate each distinct source value once, sent under the first key that uses it
+    keys_by_value = {}
+    for key, value in json_to_translate.items():
+        keys_by_value.setdefault(value, []).append(key)
+
+    logger.info("%s keys to translate for %s (%s), %s unique values.", len(json_to_translate), lang_name, lang, len(keys_by_value))
+    return target_data, keys_by_value
+
+
+async def translate_language(client, sem, lang, keys_by_value, use_batch_api):
+    """Translate the given source values for a target language, with the Batch API if use_batch_api is set.
+
+    Returns a dict of {key: translation} for every key of the values that were translated.
+    """
+    unique_to_translate = {keys[0]: value for value, keys in keys_by_value.items()}
 
     # Translate the JSON text
-    print(f"{len(json_to_translate)} keys to translate for {lang_name} ({TARGET_LANG}).")
-    translated_data = translate_text_partitioned(client, json_to_translate, chars_per_partition=CHARS_PER_PARTITION)
+    if use_batch_api:
+        translated_unique = await translate_text_batched(client, unique_to_translate, lang, chars_per_partition=CHARS_PER_PARTITION)
+    else:
+        translated_unique = await translate_text_partitioned(client, sem, unique_to_translate, lang, chars_per_partition=CHARS_PER_PARTITION)
+
+    # Copy translations to all keys sharing a source value and cache them for later runs
+    translated_data = {}
+    for value, keys in keys_by_value.items():
+        translation = translated_unique.get(keys[0])
+        if not isinstance(translation, str):
+            continue
+        save_cached_translation(lang, value, translation)
+        for key in keys:
+            translated_data[key] = translation
+
+    return translated_data
+
+
+def save_language(lang, all_keys, target_data, translated_data):
+    """Save the translations of a target language in source key order."""
+    target_path = f"{LOCALES_DIR}/{lang}.json"
 
     # Update target_data with translated values
     ordered_data = {}
@@ -219,10 +652,120 @@ def main():
             ordered_data[key] = target_data[key]
 
     # Save updated file
-    with open(target_path, "w", encoding="utf-8") as f:
-        json.dump(ordered_data, f, ensure_ascii=False, indent=4)
+    save_locale_dict(target_path, ordered_data)
+
+    logger.info("Translations updated for %s (%s).", TARGET_LANG_NAMES[lang], lang)
+
+
+async def translate_and_save_language(client, sem, lang, all_keys, target_data, keys_by_value, use_batch_api):
+    translated_data = await translate_language(client, sem, lang, keys_by_value, use_batch_api)
+    save_language(lang, all_keys, target_data, translated_data)
+
+
+def report_failure(lang, e):
+    log_error(e, lang)
+    logger.error("Error occurred while translating %s (%s): %s", TARGET_LANG_NAMES[lang], lang, e)
+
+
+async def run():
+    # ensure target languages are set
+    if not TARGET_LANGS:
+        logger.info("TARGET_LANG environment variable is not set. Exiting.")
+        return
+
+    # skip the source language if it was listed
+    target_langs = []
+    for lang in TARGET_LANGS:
+        if lang == SOURCE_LANG:
+            logger.info("Target language %s is the same as source language %s. No translation needed.", lang, SOURCE_LANG)
+        elif lang not in target_langs:
+            target_langs.append(lang)
+    if not target_langs:
+        return
+
+    # exit with error if OPENAI_API_KEY is not set
+    if "OPENAI_API_KEY" not in os.environ:
+        raise Exception("Environment variable 'OPENAI_API_KEY' is not set. Exiting.")
+
+    # source json and changes are shared by all target languages
+    all_keys = get_source_dict()
+    changes = get_changed_keys()
+    # manually requested bulk runs can opt into the cheaper, slower Batch API
+    use_batch_api = os.getenv("USE_BATCH_API") == "true"
+
+    # one client for all languages, only created once a request has to be made
+    client = None
+    failed = []
+    try:
+        # Collect batches submitted by earlier runs into the translation cache first,
+        # so prepare_language picks their results up as cache hits
+        running_batches = set()
+        for lang in target_langs:
+            try:
+                pending_batch = load_pending_batch(lang)
+                if pending_batch is None:
+                    continue
+                if client is None:
+                    client = create_client()
+                if await collect_pending_batch(client, lang, pending_batch):
+                    running_batches.add(lang)
+            except Exception as e:
+                # the language is still translated below; a batch that could not be collected
+                # is kept for the next run, so don't submit its keys again in the meantime
+                report_failure(lang, e)
+                failed.append(lang)
+                if load_pending_batch(lang) is not None:
+                    running_batches.add(lang)
+
+        # Check all languages before translating; languages with nothing to
+        # translate are saved right away, e.g. to drop keys removed from source json
+        pending = {}
+        for lang in target_langs:
+            try:
+                target_data, keys_by_value = prepare_language(lang, all_keys, changes)
+                if keys_by_value and use_batch_api and lang in running_batches:
+                    # don't submit the same keys again while the earlier batch is running
+                    logger.info("Not submitting a new batch for %s (%s) until the running one is collected.", TARGET_LANG_NAMES[lang], lang)
+                    keys_by_value = {}
+                if keys_by_value:
+                    pending[lang] = (target_data, keys_by_value)
+                else:
+                    save_language(lang, all_keys, target_data, {})
+            except Exception as e:
+                report_failure(lang, e)
+                failed.append(lang)
+
+        if pending:
+            if client is None:
+                client = create_client()
+            # one request limit for all languages
+            sem = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+            tasks = [
+                translate_and_save_language(client, sem, lang, all_keys, target_data, keys_by_value, use_batch_api)
+                for lang, (target_data, keys_by_value) in pending.items()
+            ]
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+
+            # report languages that failed entirely, after the others have been saved
+            for lang, result in zip(pending, results):
+                if isinstance(result, BaseException):
+                    report_failure(lang, result)
+                    failed.append(lang)
+        else:
+            logger.info("No keys to translate.")
+    finally:
+        if client is not None:
+            await client.close()
+
+    if failed:
+        raise Exception(f"Translation failed for: {', '.join(dict.fromkeys(failed))}")
 
-    print(f"Translations updated for {lang_name} ({TARGET_LANG}).")
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(message)s")
+    # httpx logs every request at INFO level
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    asyncio.run(run())
 
 
 if __name__ == "__main__":